@@ -5,6 +5,12 @@ import { Upload, Download, Play, Pause, Trash2, Eye, EyeOff, Mail, CheckCircle,
 import * as XLSX from 'xlsx';
 import StatsPanel from './components/stats-panel';
 
+// 以二进制帧发送 UTF-8 JSON, 后端直接用 orjson 解析字节, 无需再解码一次
+const encoder = new TextEncoder();
+const sendMessage = (socket: WebSocket, message: object) => {
+  socket.send(encoder.encode(JSON.stringify(message)));
+};
+
 interface DeduplicatedUrl {
   url: string;
   reason: string;
@@ -133,36 +139,45 @@ const EmailExtractorApp = () => {
     const wsUrl = `${protocol}//${wsBase}/ws`;
     console.log('Connecting to WebSocket:', wsUrl);
     const websocket = new WebSocket(wsUrl);
+    // 后端以二进制帧发送 UTF-8 JSON
+    websocket.binaryType = 'arraybuffer';
+    const decoder = new TextDecoder();
 
     websocket.onopen = () => {
       addLog(`WebSocket连接已建立 (${backendMode === 'local' ? '本地' : '线上'})`, 'success');
     };
 
     websocket.onmessage = (event) => {
-      const data = JSON.parse(event.data);
-      console.log("🚀 ~ connectWebSocket ~ data:", data)
-
-      if (data.type === 'log') {
-        addLog(data.message, data.level);
-      } else if (data.type === 'progress') {
-        setProgress(data.progress);
-      } else if (data.type === 'email') {
-        console.log('data.emails:', data.emails);
-        setEmails(prev => {
-          const newEmails = [...prev, ...data.emails];
-          return [...new Set(newEmails)];
-        });
-      } else if (data.type === 'failed_urls') {
-        setFailedUrls(data.failed_urls || []);
-      } else if (data.type === 'no_email_urls') {
-        setNoEmailUrls(data.no_email_urls || []);
-      } else if (data.type === 'deduplicated_urls') {
-        setDeduplicatedUrls(data.deduplicated_urls || []);
-      } else if (data.type === 'complete') {
-        addLog(data.message || '任务完成', 'success');
-        setIsExtracting(false);
-      } else if (data.type === 'error') {
-        addLog(`错误: ${data.message}`, 'error');
+      const raw = typeof event.data === 'string' ? event.data : decoder.decode(event.data);
+      // 后端会把积压的消息合并为数组发送
+      const payload = JSON.parse(raw);
+      const messages = Array.isArray(payload) ? payload : [payload];
+
+      for (const data of messages) {
+        console.log("🚀 ~ connectWebSocket ~ data:", data)
+
+        if (data.type === 'log') {
+          addLog(data.message, data.level);
+        } else if (data.type === 'progress') {
+          setProgress(data.progress);
+        } else if (data.type === 'email') {
+          console.log('data.emails:', data.emails);
+          setEmails(prev => {
+            const newEmails = [...prev, ...data.emails];
+            return [...new Set(newEmails)];
+          });
+        } else if (data.type === 'failed_urls') {
+          setFailedUrls(data.failed_urls || []);
+        } else if (data.type === 'no_email_urls') {
+          setNoEmailUrls(data.no_email_urls || []);
+        } else if (data.type === 'deduplicated_urls') {
+          setDeduplicatedUrls(data.deduplicated_urls || []);
+        } else if (data.type === 'complete') {
+          addLog(data.message || '任务完成', 'success');
+          setIsExtracting(false);
+        } else if (data.type === 'error') {
+          addLog(`错误: ${data.message}`, 'error');
+        }
       }
     };
 
@@ -199,11 +214,11 @@ const EmailExtractorApp = () => {
     // 等待 WebSocket 连接建立后再发送消息
     websocket?.addEventListener('open', () => {
       try {
-        websocket.send(JSON.stringify({
+        sendMessage(websocket, {
           action: 'start',
           urls: urlList,
           showBrowser
-        }));
+        });
         addLog(`已提交 ${urlList.length} 个URL进行处理`, 'success');
       } catch (error) {
         const errorMessage = error instanceof Error ? error.message : '未知错误';
@@ -219,7 +234,7 @@ const EmailExtractorApp = () => {
     addLog(isPaused ? '继续提取...' : '已暂停提取', 'warning');
 
     if (ws) {
-      ws.send(JSON.stringify({ action: isPaused ? 'resume' : 'pause' }));
+      sendMessage(ws, { action: isPaused ? 'resume' : 'pause' });
     }
   };
 
@@ -229,7 +244,7 @@ const EmailExtractorApp = () => {
     addLog('已停止提取', 'error');
 
     if (ws) {
-      ws.send(JSON.stringify({ action: 'stop' }));
+      sendMessage(ws, { action: 'stop' });
       ws.close();
     }
   };
@@ -1,32 +1,355 @@
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
 import asyncio
+import hashlib
 import logging
 import re
 from typing import List, Set, Optional
 import os
 import platform
-from playwright_stealth import Stealth
 import time
 from free_proxy_manager import get_proxy_manager
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 预编译正则 (避免每次调用时查找 re 模块缓存和规范化 flags)
+_EMAIL_PATTERN = r'\b[a-z\d\-][_a-z\d\-+]*(?:\.[_a-z\d\-+]*)*@[a-z\d]+[a-z\d\-]*(?:\.[a-z\d\-]+)*(?:\.[a-z]{2,63})\b'
+
+
+def _compile_email_re():
+    """优先使用 RE2 (DFA, 无回溯, 适合扫描大段 HTML), 未安装时回退到 re"""
+    try:
+        import re2
+        # 模式中没有反向引用, RE2 可直接编译; 用内联 (?i) 兼容不同的 re2 绑定
+        return re2.compile('(?i)' + _EMAIL_PATTERN)
+    except Exception:
+        # 邮箱只含 ASCII 字符: ASCII 模式下 \b 和忽略大小写不再查 Unicode 表, 效果与按字节扫描相当
+        return re.compile(_EMAIL_PATTERN, re.IGNORECASE | re.ASCII)
+
+
+_EMAIL_RE = _compile_email_re()
+
+
+def _compile_hyperscan_finder():
+    """构建基于 Hyperscan 的邮箱查找函数 (需要安装 hyperscan), 返回结果与 _EMAIL_RE.findall 一致
+
+    Hyperscan 只负责以 DFA 速度定位候选区间, 再用 re 在这些小区间内取出匹配:
+    SOM_LEFTMOST 模式不支持 {2,63} 这样的大范围有界重复, 所以定位时放宽为 {2,},
+    它匹配到的区间覆盖了原模式的全部匹配
+    """
+    import hyperscan
+    
+    database = hyperscan.Database()
+    database.compile(
+        expressions=[_EMAIL_PATTERN.replace('{2,63}', '{2,}').encode()],
+        ids=[0],
+        flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SOM_LEFTMOST],
+    )
+    # 字节模式下 \b 只把 ASCII 字母数字视为单词字符, 与 re.ASCII 的 str 模式一致
+    email_re_bytes = re.compile(_EMAIL_PATTERN.encode(), re.IGNORECASE)
+    
+    def findall(text: str) -> List[str]:
+        data = text.encode('utf-8', 'ignore')
+        spans = []
+        database.scan(data, match_event_handler=lambda _id, start, end, _flags, _ctx: spans.append((start, end)))
+        if not spans:
+            return []
+        
+        # 合并重叠区间
+        spans.sort()
+        merged = [list(spans[0])]
+        for start, end in spans[1:]:
+            if start < merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        
+        # pos 不等同于切片: 区间开头的 \b 仍能看到前一个字符;
+        # endpos 则等同于把字符串截断在 endpos, 区间末尾的 \b/$ 看不到之后的字符.
+        # 这里结果仍然正确, 是因为区间结束位置取自 Hyperscan 报告的匹配结束位置,
+        # 模式末尾的 \b 在完整数据中已在该处成立, 即结束位置本身就落在单词边界上
+        return [
+            m.decode('ascii')
+            for start, end in merged
+            for m in email_re_bytes.findall(data, start, end)
+        ]
+    
+    return findall
+
+
+try:
+    _find_emails = _compile_hyperscan_finder()
+except Exception:
+    _find_emails = _EMAIL_RE.findall
+# HTML/JS 转义残留的前缀 (固定字面量, 用 startswith 判断即可)
+_JUNK_PREFIXES = ('x3', 'x2', 'u003', 'u0022', 'sx_mrsp_', '3a')
+# 看起来像邮箱的资源文件名 (如 logo@2x.png)
+_BAD_SUFFIXES = frozenset({'png', 'jpg', 'gif', 'css', 'webp', 'crx1', 'js'})
+# 常见的假邮箱/占位邮箱前缀
+_FAKE_EMAIL_PREFIXES = frozenset({
+    "the", "2", "3", "4", "123", "20info", "aaa", "ab", "abc", "acc", 
+    "acc_kaz", "account", "accounts", "accueil", "ad", "adi", "adm", 
+    "an", "and", "available", "cc", "com", "domain", "domen", 
+    "email", "fb", "foi", "for", "found", "get", "here", 
+    "includes", "linkedin", "mailbox", "more", "my_name", "name", 
+    "need", "nfo", "ninfo", "now", "online", "post", "sales2", 
+    "test", "up", "we", "www", "xxx", "xxxxx", "username", 
+    "firstname.lastname", "your.name", "unsubscribe"
+})
+# 垃圾关键词 (子串匹配, 邮箱已转为小写)
+_SPAM_KEYWORDS = ('nondelivery', 'feedback', 'notification')
+# 垃圾域名: 匹配完整的域名部分 / 域名开头
+_SPAM_DOMAINS = frozenset({'linkedin.com', 'linkedhelper.com'})
+_SPAM_DOMAIN_PREFIXES = ('sentry',)
+
+
+def _alternation(words) -> str:
+    """把字面量集合转成正则交替 (排序保证模式稳定)"""
+    return '|'.join(map(re.escape, sorted(words)))
+
+
+# 所有拒绝规则按原因分组, 合并成一个交替正则: 每个候选邮箱只需一次 C 层扫描
+_REJECT_RULES = (
+    ('spam模式', r'(?:no|not)[-_]*reply|mailer[-_]*daemon|reply.+\d{5,}'),
+    ('过多数字', r'\d{13,}'),
+    ('垃圾关键词', _alternation(_SPAM_KEYWORDS)),
+    ('垃圾关键词', r'@(?:' + _alternation(_SPAM_DOMAINS) + r')$|@(?:' + _alternation(_SPAM_DOMAIN_PREFIXES) + ')'),
+    ('文件后缀', r'\.(?:' + _alternation(_BAD_SUFFIXES) + r')$'),
+)
+_REJECT_PATTERN = '|'.join(pattern for _, pattern in _REJECT_RULES)
+
+
+def _compile_reject_search():
+    """与邮箱正则一样优先使用 RE2, 未安装时回退到 re"""
+    try:
+        import re2
+        return re2.compile('(?i)' + _REJECT_PATTERN).search
+    except Exception:
+        return re.compile(_REJECT_PATTERN, re.IGNORECASE | re.ASCII).search
+
+
+_is_rejected = _compile_reject_search()
+# 仅 DEBUG 日志使用: 每条规则一个捕获组, 由 lastindex 得到过滤原因
+_REJECT_REASON_RE = re.compile(
+    '|'.join('(' + pattern + ')' for _, pattern in _REJECT_RULES),
+    re.IGNORECASE | re.ASCII,
+)
+# 按 HTML 哈希缓存提取结果的最大条目数
+_HTML_CACHE_SIZE = 256
+# 单次邮箱扫描的最大字符数 (去掉标签/脚本之后)
+_MAX_SCAN_CHARS = 2_000_000
+
+# 验证码/机器人检测页面的标题或 URL 特征
+_CAPTCHA_RE = re.compile(
+    r'captcha|robot|challenge|verification|security check|are you human|prove you|cloudflare',
+    re.IGNORECASE,
+)
+
+# 拦截的资源类型 (Playwright request.resource_type 的取值): 邮箱不会出现在这些资源中
+# (保留 document/script/xhr/fetch/eventsource, JS 渲染的邮箱仍能出现)
+# ping 和 cspviolationreport 是 Chromium 对 sendBeacon/<a ping> 和 CSP 报告的类型名
+_BLOCKED_RESOURCE_TYPES = frozenset({
+    'image', 'media', 'font', 'stylesheet', 'texttrack',
+    'websocket', 'manifest', 'ping', 'cspviolationreport',
+})
+
+# 扫描前剔除的非文本区域: <script>/<style> 块 (保留 JSON-LD 结构化数据) 和 data: URI
+_SCRIPT_STYLE_RE = re.compile(
+    r'<(script|style)\b(?![^>]*application/ld\+json)[^>]*>.*?</\1\s*>',
+    re.IGNORECASE | re.DOTALL,
+)
+# 必须带 MIME 类型 (如 data:image/png;base64,...), 不能含空白, 否则正文中的 "Personal data: ..." 也会被误删
+_DATA_URI_RE = re.compile(r'data:[\w.+-]+/[\w.+-]+[;,][^\s"\'<>]{20,}')
+# 标签内 mailto 链接的地址部分, 在去掉标签前先提取为普通文本
+_MAILTO_HREF_RE = re.compile(r'href\s*=\s*["\']?mailto:([^"\'?>\s]+)', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]+>')
+# 含 @ 的标签, 以及其中可能放邮箱的属性值 (content/title/value/alt/data-*)
+_TAG_WITH_AT_RE = re.compile(r'<[^>@]*@[^>]*>')
+_ATTR_VALUE_RE = re.compile(
+    r'''\s(?:content|title|value|alt|data-[\w-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''',
+    re.IGNORECASE,
+)
+# HTML 实体形式的 @
+_AT_ENTITY_RE = re.compile(r'&(?:#0*64|#x0*40|commat);', re.IGNORECASE)
+_URL_SCHEME_RE = re.compile(r'^https?://')
+_URL_WWW_RE = re.compile(r'^www\.')
+
+# 收集 mailto 链接中的邮箱地址 (去掉 mailto: 前缀和 ?subject= 等参数)
+_PAGE_TEXT_JS = """() => [
+    document.body ? document.body.innerText : '',
+    Array.from(document.querySelectorAll('a[href^="mailto:" i]'), el => {
+        const href = (el.getAttribute('href') || '').replace(/^mailto:/i, '').split('?')[0];
+        try {
+            return decodeURIComponent(href);
+        } catch (e) {
+            return href;
+        }
+    }),
+]"""
+
+# 页面内容就绪: 出现 mailto 链接, 或正文文本中出现 '@'
+_CONTENT_READY_JS = """() => document.querySelector('a[href^="mailto:" i]') !== null
+    || (document.body !== null && document.body.innerText.includes('@'))"""
+
+# 正文中出现形似邮箱的文本 (首次提取为空时, 等待动态加载的邮箱出现)
+_EMAIL_APPEARED_JS = r"""() => document.body !== null
+    && /[\w.+-]+@[\w-]+\.[\w.-]+/.test(document.body.innerText)"""
+
+# 英文链接的 CSS 预选, 覆盖大多数导航/页脚里的语言切换链接
+_ENGLISH_LINK_SELECTOR = (
+    'a[hreflang="en" i], a[lang="en" i], a[href*="/en/"], '
+    'a[title*="english" i], a[aria-label*="english" i]'
+)
+
+# 返回预选结果中第一个可用的链接; 当前已在 /en/ 页面时忽略 /en/ 链接
+_FIRST_ENGLISH_HREF_JS = """links => {
+    const onEnglish = window.location.href.includes('/en/');
+    const link = links.find(l => !(onEnglish && l.href.toLowerCase().includes('/en/')));
+    return link ? link.href : null;
+}"""
+
+# 预选无结果时的完整扫描
+_ENGLISH_LINK_JS = """() => {
+    const links = Array.from(document.querySelectorAll('a'));
+    for (const link of links) {
+        const text = link.innerText.trim().toLowerCase();
+        const href = link.href.toLowerCase();
+        const title = (link.title || '').toLowerCase();
+        const ariaLabel = (link.getAttribute('aria-label') || '').toLowerCase();
+        
+        if (text === 'english' || text === 'en' || text.includes('english version')) {
+            return link.href;
+        }
+        
+        if (title.includes('english') || ariaLabel.includes('english')) {
+            return link.href;
+        }
+        
+        if ((href.includes('/en/') || href.endsWith('/en')) && !window.location.href.includes('/en/')) {
+            return link.href;
+        }
+    }
+    return null;
+}"""
+
+# 浏览器启动参数
+_BROWSER_ARGS = (
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--disable-blink-features=AutomationControlled',
+    '--no-first-run',
+    '--no-zygote',
+    '--disable-infobars',
+    '--start-maximized',
+    '--disable-web-security',
+    '--disable-features=IsolateOrigins,site-per-process',
+    '--disable-site-isolation-trials',
+    '--disable-features=BlockInsecurePrivateNetworkRequests',
+)
+
+# 每个浏览器上下文的额外请求头 (模拟真实 Chrome)
+_EXTRA_HTTP_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br, zstd",
+    "sec-ch-ua": '"Google Chrome";v="131", "Chromium";v="131", "Not_A Brand";v="24"',
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": '"Windows"',
+    "sec-fetch-dest": "document",
+    "sec-fetch-mode": "navigate",
+    "sec-fetch-site": "none",
+    "sec-fetch-user": "?1",
+    "upgrade-insecure-requests": "1",
+}
+
+# 额外的 JavaScript 反检测 (在 Stealth 插件之后注入)
+_EXTRA_INIT_JS = """
+// 覆盖 webdriver 属性
+Object.defineProperty(navigator, 'webdriver', {
+    get: () => undefined
+});
+
+// 覆盖 chrome 对象
+window.chrome = {
+    runtime: {}
+};
+
+// 覆盖 permissions
+const originalQuery = window.navigator.permissions.query;
+window.navigator.permissions.query = (parameters) => (
+    parameters.name === 'notifications' ?
+        Promise.resolve({ state: Notification.permission }) :
+        originalQuery(parameters)
+);
+
+// 覆盖 plugins
+Object.defineProperty(navigator, 'plugins', {
+    get: () => [1, 2, 3, 4, 5]
+});
+
+// 覆盖 languages
+Object.defineProperty(navigator, 'languages', {
+    get: () => ['en-US', 'en']
+});
+"""
+
+async def _block_resources(route):
+    """路由处理: 中止图片/媒体/字体/样式表等与邮箱无关的请求, 其余请求放行"""
+    if route.request.resource_type in _BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+def _attr_values(match) -> str:
+    """标签替换为其中可能含邮箱的属性值, 以空格分隔"""
+    values = [''.join(groups) for groups in _ATTR_VALUE_RE.findall(match.group(0))]
+    return ' ' + ' '.join(values) + ' '
+
+
+def _strip_prefix(email: str) -> str:
+    """去掉 HTML/JS 转义残留的前缀 (x3、u003 等), 清理后无效则返回空字符串"""
+    if not email.startswith(_JUNK_PREFIXES):
+        return email
+    
+    for prefix in _JUNK_PREFIXES:
+        if email.startswith(prefix):
+            cleaned = email[len(prefix):]
+            break
+    
+    # 只去掉了本地部分开头的字面量, 无需重新跑完整正则, 做结构检查即可
+    if not cleaned or not cleaned[0].isalnum() or cleaned.count('@') != 1:
+        return ''
+    return cleaned
+
 class EmailExtractor:
-    FAKE_EMAIL_PREFIXES = [
-        "the", "2", "3", "4", "123", "20info", "aaa", "ab", "abc", "acc", 
-        "acc_kaz", "account", "accounts", "accueil", "ad", "adi", "adm", 
-        "an", "and", "available", "cc", "com", "domain", "domen", 
-        "email", "fb", "foi", "for", "found", "get", "here", 
-        "includes", "linkedin", "mailbox", "more", "my_name", "name", 
-        "need", "nfo", "ninfo", "now", "online", "post", "sales2", 
-        "test", "up", "we", "www", "xxx", "xxxxx", "username", 
-        "firstname.lastname", "your.name", "unsubscribe"
-    ]
+    FAKE_EMAIL_PREFIXES = _FAKE_EMAIL_PREFIXES
+    # playwright / playwright_stealth 在首次初始化时才导入, 导入结果缓存在类上
+    _async_playwright = None
+    _PlaywrightTimeout = ()  # 导入前 except 子句不匹配任何异常
+    # Stealth 只保存配置, 所有上下文共用一个实例
+    _STEALTH_INSTANCE = None
     
+    @classmethod
+    def _load_playwright(cls):
+        """按需导入 playwright 相关模块 (启动时不加载浏览器驱动)"""
+        if cls._async_playwright is not None:
+            return
+        from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
+        from playwright_stealth import Stealth
+        
+        cls._async_playwright = staticmethod(async_playwright)
+        cls._PlaywrightTimeout = PlaywrightTimeout
+        cls._STEALTH_INSTANCE = Stealth()
     
-    def __init__(self, headless: bool = False, use_proxy: bool = False):
+    
+    def __init__(self, headless: bool = False, use_proxy: bool = False, max_concurrency: Optional[int] = None,
+                 disable_resources: bool = True):
         self.headless = headless
+        # 是否拦截图片/字体/媒体等资源请求
+        self.disable_resources = disable_resources
+        # 并发限制 - 默认从环境变量获取，默认为 3 (适合 Render 等容器环境)
+        self.max_concurrency = max_concurrency or int(os.getenv("MAX_CONCURRENCY", "3"))
         self.use_proxy_fallback = use_proxy  # 改名：失败时才使用代理
         self.proxy_manager = get_proxy_manager(use_proxy=use_proxy) if use_proxy else None
         self.current_proxy = None
@@ -35,87 +358,102 @@ class EmailExtractor:
         self.context = None
         self.paused = False
         self.stopped = False
+        # 未暂停时处于 set 状态; 暂停时 clear, 等待中的任务在 resume/stop 时立即被唤醒
+        self._resume_event = asyncio.Event()
+        self._resume_event.set()
         self._pages = []  # 跟踪所有打开的页面
+        self._page_pool = None  # 主上下文的可复用页面池 (asyncio.Queue)
+        self._html_email_cache = {}  # HTML 哈希 -> 提取到的邮箱
+        self._proxy_context = None  # CAPTCHA 重试共用的代理上下文
+        self._proxy_context_lock = asyncio.Lock()
         self._failed_urls_needing_proxy = set()  # 记录需要代理的URL
     
-    def _extract_emails_from_text(self, text: str, domain: str = None) -> Set[str]:
-        """Extract and filter emails from text"""
-        if not text:
+    def _extract_emails_from_text(self, text: str, domain: str = None, html: bool = True) -> Set[str]:
+        """Extract and filter emails from text
+
+        html 为 False 时 (如 innerText) 跳过标签/脚本剔除, 避免误删 "Name <a@b.com>" 这类文本
+        """
+        # 没有 @ 就不可能有邮箱, 跳过后续所有正则扫描
+        if not text or '@' not in text:
             return set()
         
         text = text.replace('\\n', ' ')
-        pattern = r'\b[a-z\d\-][_a-z\d\-+]*(?:\.[_a-z\d\-+]*)*@[a-z\d]+[a-z\d\-]*(?:\.[a-z\d\-]+)*(?:\.[a-z]{2,63})\b'
-        matches = re.findall(pattern, text, re.IGNORECASE)
+        if html:
+            # 脚本/样式/内联资源是大部分误匹配 (x3/u003 前缀、长数字、.js/.css) 的来源
+            text = _SCRIPT_STYLE_RE.sub(' ', text)
+            text = _DATA_URI_RE.sub(' ', text)
+            # 标签和属性占 HTML 的大部分字节, 去掉后扫描量大幅减少; 只保留可能含邮箱的部分
+            if '<' in text:
+                # 把 mailto 地址替换为 '> 地址 <', 标签被拆成前后两段分别去掉, 地址留在文本中
+                text = _MAILTO_HREF_RE.sub(lambda m: '> ' + m.group(1) + ' <', text)
+                # 含 @ 的标签替换为其 content/title/value/alt/data-* 属性值 (如 <meta content="a@b.com">)
+                text = _TAG_WITH_AT_RE.sub(_attr_values, text)
+                text = _TAG_RE.sub(' ', text)
+        # 超大页面 (SPA 数据、商品目录) 只扫描前一部分, 限制单页最坏耗时
+        if len(text) > _MAX_SCAN_CHARS:
+            logger.info("页面文本过长 (%d 字符), 只扫描前 %d 字符", len(text), _MAX_SCAN_CHARS)
+            text = text[:_MAX_SCAN_CHARS]
+        # 先去重再过滤: 同一邮箱在 HTML 中常重复出现多次
+        # (正则匹配结果不含空白字符, 无需 strip)
+        candidates = {m.lower() for m in _find_emails(text)}
         
-        if not matches:
+        if not candidates:
             return set()
         
-        valid_emails = set()
-        filtered_count = 0
+        # 各阶段用集合推导式完成, 减少逐个邮箱的分支和名字查找开销
+        in_domain = {e for e in candidates if domain in e} if domain else candidates
         
-        for email in matches:
-            email = email.lower().strip()
-            
-            if email in valid_emails:
-                continue
-            
-            if domain and domain not in email:
-                logger.debug(f"过滤邮箱 (域名不匹配): {email}")
-                filtered_count += 1
-                continue
-            
-            if email.endswith(('.png', '.jpg', '.gif', '.css', '.webp', '.crx1', '.js')):
-                logger.debug(f"过滤邮箱 (文件后缀): {email}")
-                filtered_count += 1
-                continue
-            
-            original = email
-            email = re.sub(r'^(x3|x2|u003|u0022|sx_mrsp_|3a)', '', email, flags=re.IGNORECASE)
-            
-            if email != original and not re.search(pattern, email, re.IGNORECASE):
-                logger.debug(f"过滤邮箱 (清理后无效): {original}")
-                filtered_count += 1
-                continue
-            
-            if re.search(r'(no|not)[-|_]*reply|mailer[-|_]*daemon|reply.+\d{5,}', email, re.IGNORECASE):
-                logger.debug(f"过滤邮箱 (spam模式): {email}")
-                filtered_count += 1
-                continue
-            
-            if re.search(r'\d{13,}', email):
-                logger.debug(f"过滤邮箱 (过多数字): {email}")
-                filtered_count += 1
-                continue
-            
-            spam_keywords = ['nondelivery', '@linkedin.com', '@sentry', '@linkedhelper.com', 'feedback', 'notification']
-            if any(keyword in email for keyword in spam_keywords):
-                logger.debug(f"过滤邮箱 (垃圾关键词): {email}")
-                filtered_count += 1
-                continue
-            
-            email_prefix = email.split('@')[0]
-            if email_prefix in self.FAKE_EMAIL_PREFIXES:
-                logger.info(f"过滤邮箱 (假前缀): {email}")
-                filtered_count += 1
-                continue
-            
-            if email:
-                logger.info(f"✓ 有效邮箱: {email}")
-                valid_emails.add(email)
+        cleaned = {_strip_prefix(e) for e in in_domain}
+        cleaned.discard('')
+        
+        fake_prefixes = _FAKE_EMAIL_PREFIXES
+        valid_emails = {
+            e for e in cleaned
+            if not _is_rejected(e)
+            # 已知 e 中恰好有一个 @, 按位置切片取本地部分
+            and e[:e.find('@')] not in fake_prefixes
+        }
+        filtered_count = len(candidates) - len(valid_emails)
+        
+        # 过滤原因只在 DEBUG 日志开启时才逐个计算
+        if logger.isEnabledFor(logging.DEBUG):
+            for email in candidates:
+                reason = self._filter_reason(email, domain, valid_emails)
+                if reason:
+                    logger.debug("过滤邮箱 (%s): %s", reason, email)
+            for email in valid_emails:
+                logger.debug("✓ 有效邮箱: %s", email)
         
         if filtered_count > 0:
-            logger.info(f"过滤 {filtered_count} 个,保留 {len(valid_emails)} 个有效邮箱")
+            logger.info("过滤 %d 个,保留 %d 个有效邮箱", filtered_count, len(valid_emails))
         
         return valid_emails
 
+    def _filter_reason(self, email: str, domain: Optional[str], valid_emails: Set[str]) -> Optional[str]:
+        """返回候选邮箱被过滤的原因, 保留的返回 None (仅用于 DEBUG 日志)"""
+        if domain and domain not in email:
+            return '域名不匹配'
+        
+        cleaned = _strip_prefix(email)
+        if not cleaned:
+            return '清理后无效'
+        if cleaned in valid_emails:
+            return None
+        match = _REJECT_REASON_RE.search(cleaned)
+        if match:
+            return _REJECT_RULES[match.lastindex - 1][0]
+        return '假前缀'
+
     async def _create_context(self, use_proxy: bool = False):
         """创建并配置一个新的浏览器上下文"""
+        self._load_playwright()
         # 获取代理配置
         proxy_config = None
         if use_proxy and self.proxy_manager:
-            proxy = self.proxy_manager.get_random_proxy()
+            proxy = self.proxy_manager.get_next_proxy()
             if proxy:
-                proxy_config = proxy
+                proxy_config = dict(proxy)  # 代理管理器返回只读映射, Playwright 需要普通 dict
+                self.current_proxy = proxy
                 logger.info(f"✓ 使用代理: {proxy_config['server']}")
             else:
                 logger.warning("⚠ 代理管理器未返回代理，使用直连")
@@ -129,55 +467,19 @@ class EmailExtractor:
             user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
             permissions=['geolocation'],
             proxy=proxy_config,
-            extra_http_headers={
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "sec-ch-ua": '"Google Chrome";v="131", "Chromium";v="131", "Not_A Brand";v="24"',
-                "sec-ch-ua-mobile": "?0",
-                "sec-ch-ua-platform": '"Windows"',
-                "sec-fetch-dest": "document",
-                "sec-fetch-mode": "navigate",
-                "sec-fetch-site": "none",
-                "sec-fetch-user": "?1",
-                "upgrade-insecure-requests": "1",
-            },
+            extra_http_headers=_EXTRA_HTTP_HEADERS,
         )
 
+        # 拦截图片/媒体/字体/样式表等请求: 邮箱不会出现在这些资源中, 跳过可显著加快页面加载
+        if self.disable_resources:
+            await context.route('**/*', _block_resources)
+
         # logger.info("应用 Stealth 插件...")
-        await Stealth().apply_stealth_async(context)
+        await self._STEALTH_INSTANCE.apply_stealth_async(context)
 
         # 额外的 JavaScript 反检测
         # logger.info("注入额外的反检测脚本...")
-        await context.add_init_script("""
-            // 覆盖 webdriver 属性
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => undefined
-            });
-            
-            // 覆盖 chrome 对象
-            window.chrome = {
-                runtime: {}
-            };
-            
-            // 覆盖 permissions
-            const originalQuery = window.navigator.permissions.query;
-            window.navigator.permissions.query = (parameters) => (
-                parameters.name === 'notifications' ?
-                    Promise.resolve({ state: Notification.permission }) :
-                    originalQuery(parameters)
-            );
-            
-            // 覆盖 plugins
-            Object.defineProperty(navigator, 'plugins', {
-                get: () => [1, 2, 3, 4, 5]
-            });
-            
-            // 覆盖 languages
-            Object.defineProperty(navigator, 'languages', {
-                get: () => ['en-US', 'en']
-            });
-        """)
+        await context.add_init_script(_EXTRA_INIT_JS)
         
         return context
 
@@ -185,36 +487,20 @@ class EmailExtractor:
         """初始化浏览器"""
         try:
             logger.info("开始初始化 Playwright...")
-            self.playwright_instance = await async_playwright().start()
+            self._load_playwright()
+            self.playwright_instance = await self._async_playwright().start()
             
-            args = [
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-dev-shm-usage',
-                '--disable-gpu',
-                '--disable-blink-features=AutomationControlled',
-                '--no-first-run',
-                '--no-zygote',
-                '--disable-infobars',
-                '--start-maximized',
-                '--disable-web-security',
-                '--disable-features=IsolateOrigins,site-per-process',
-                '--disable-site-isolation-trials',
-                '--disable-features=BlockInsecurePrivateNetworkRequests',
-            ]
-
             logger.info(f"启动浏览器 (headless={self.headless})...")
             self.browser = await self.playwright_instance.chromium.launch(
                 headless=self.headless,
-                args=args,
+                args=_BROWSER_ARGS,
             )
 
             logger.info("创建主浏览器上下文...")
             self.context = await self._create_context(use_proxy=use_proxy)
 
-            # 验证启动
-            test_page = await self.context.new_page()
-            await test_page.close()
+            # 预先创建页面池, 同时验证启动
+            await self._fill_page_pool()
             
             logger.info(f"浏览器初始化成功 (headless={self.headless})")
             return self
@@ -285,83 +571,221 @@ class EmailExtractor:
     async def _find_english_link(self, page) -> str:
         """查找英文链接"""
         try:
-            english_url = await page.evaluate("""() => {
-                const links = Array.from(document.querySelectorAll('a'));
-                for (const link of links) {
-                    const text = link.innerText.trim().toLowerCase();
-                    const href = link.href.toLowerCase();
-                    const title = (link.title || '').toLowerCase();
-                    const ariaLabel = (link.getAttribute('aria-label') || '').toLowerCase();
-                    
-                    if (text === 'english' || text === 'en' || text.includes('english version')) {
-                        return link.href;
-                    }
-                    
-                    if (title.includes('english') || ariaLabel.includes('english')) {
-                        return link.href;
-                    }
-                    
-                    if ((href.includes('/en/') || href.endsWith('/en')) && !window.location.href.includes('/en/')) {
-                        return link.href;
-                    }
-                }
-                return null;
-            }""")
+            # 先用 CSS 选择器预选常见的语言切换链接, 无命中时才遍历全部 <a>
+            english_url = await page.eval_on_selector_all(_ENGLISH_LINK_SELECTOR, _FIRST_ENGLISH_HREF_JS)
+            if not english_url:
+                english_url = await page.evaluate(_ENGLISH_LINK_JS)
             
             return english_url
         except Exception as e:
             logger.warning(f"查找英文链接出错: {str(e)}")
             return None
 
+    async def _wait_first(self, *waits) -> Optional[int]:
+        """同时等待多个 Playwright 等待条件, 返回第一个成功的序号, 全部失败 (超时) 返回 None
+
+        其余未完成的等待会被取消, 所有异常都被取回, 避免 Future exception was never retrieved 错误
+        """
+        tasks = [asyncio.ensure_future(w) for w in waits]
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:
+                    if task in done and task.exception() is None:
+                        return tasks.index(task)
+            return None
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _navigate(self, page, url: str, timeout: int):
+        """访问页面: 收到响应 (commit) 后同时等待邮箱相关内容和 DOMContentLoaded
+
+        内容信号只用来决定是否还需要 _wait_for_content 的额外等待;
+        无论哪个先到, 都要等文档解析完成再提取, 否则页面后部 (页脚、联系方式区块) 的邮箱会被漏掉
+        """
+        await page.goto(url, wait_until='commit', timeout=timeout)
+        winner = await self._wait_first(
+            page.wait_for_function(_CONTENT_READY_JS, timeout=timeout),
+            page.wait_for_load_state('domcontentloaded', timeout=timeout),
+        )
+        if winner is None:
+            raise self._PlaywrightTimeout(f"页面加载超时 ({timeout}ms): {url}")
+        if winner == 0:
+            # 已出现邮箱相关内容, 但文档可能仍在解析
+            await page.wait_for_load_state('domcontentloaded', timeout=timeout)
+        else:
+            # 文档已解析但还没有邮箱相关内容, 再短暂等待动态加载
+            await self._wait_for_content(page)
+
+    async def _wait_for_content(self, page, timeout: int = 3000):
+        """等待页面出现 mailto 链接或正文包含 '@', 超时后继续 (没有邮箱的页面最多等待 timeout)"""
+        try:
+            await page.wait_for_function(_CONTENT_READY_JS, timeout=timeout)
+        except Exception as e:
+            logger.debug("等待页面内容超时(这是正常的): %s", e)
+
+    async def _extract_from_content(self, page) -> Set[str]:
+        """从页面提取邮箱: 优先可见文本 + mailto 链接, 都没有结果时再扫描整页 HTML
+
+        以 HTML 哈希为键缓存整页扫描的结果: 重试时 HTML 未变化, 或不同 URL 返回相同页面
+        (www/裸域名、尾部斜杠、跟踪参数) 时直接复用
+        """
+        # 一次 evaluate 取回 innerText 和 mailto 地址: 文本远小于 HTML, 且没有标签/样式/data URI 噪音
+        text, mailtos = await page.evaluate(_PAGE_TEXT_JS)
+        # 文本中没有 @ 且没有 mailto 链接时, 连拼接字符串和调用过滤函数都省掉
+        if mailtos or '@' in text:
+            # mailto 地址仍然走一遍过滤规则 (noreply、假前缀等)
+            emails = self._extract_emails_from_text(text + ' ' + ' '.join(mailtos), html=False)
+            if emails:
+                logger.debug("从可见文本和 %d 个 mailto 链接提取到 %d 个邮箱", len(mailtos), len(emails))
+                return emails
+        
+        # 兜底: 邮箱可能只出现在隐藏元素、属性值 (content/title/value/alt/data-*, 见 _ATTR_VALUE_RE) 或 JSON-LD 中
+        page_html = await page.content()
+        logger.debug("HTML长度: %d", len(page_html))
+        
+        html_key = hashlib.blake2b(page_html.encode('utf-8', 'ignore'), digest_size=16).digest()
+        cached = self._html_email_cache.get(html_key)
+        if cached is not None:
+            logger.debug("相同 HTML 已提取过, 复用结果")
+            return set(cached)
+        
+        # 还原用 HTML 实体混淆的 @ (如 info&#64;example.com)
+        page_html = _AT_ENTITY_RE.sub('@', page_html)
+        emails = self._extract_emails_from_text(page_html)
+        
+        if len(self._html_email_cache) >= _HTML_CACHE_SIZE:
+            # 淘汰最早加入的条目
+            self._html_email_cache.pop(next(iter(self._html_email_cache)))
+        self._html_email_cache[html_key] = emails
+        
+        return emails
+
     async def _extract_from_page(self, page, retry_if_empty: bool = True) -> Set[str]:
         """从当前页面提取邮箱"""
         try:
-            ready_state = await page.evaluate('document.readyState')
-            logger.debug(f"页面状态: {ready_state}")
-            
-            page_html = await page.content()
-            page_text = await page.inner_text('body')
-            
-            logger.debug(f"HTML长度: {len(page_html)}, 文本长度: {len(page_text)}")
-            
-            emails_from_html = self._extract_emails_from_text(page_html)
-            emails_from_text = self._extract_emails_from_text(page_text)
+            all_emails = await self._extract_from_content(page)
             
-            all_emails = emails_from_html.union(emails_from_text)
-            
-            # 如果第一次没找到邮箱，等待一下再试一次（可能是动态加载）
+            # 如果第一次没找到邮箱，等待邮箱出现或网络空闲后再试一次（可能是动态加载）
+            # 只有快速路径没有结果时才等待网络空闲; 都超时说明没有新邮箱, 不重复提取
             if len(all_emails) == 0 and retry_if_empty:
-                logger.debug("首次未找到邮箱，等待2秒后重试...")
-                await asyncio.sleep(2)
-                
-                # 重新获取内容
-                page_html = await page.content()
-                page_text = await page.inner_text('body')
-                
-                emails_from_html = self._extract_emails_from_text(page_html)
-                emails_from_text = self._extract_emails_from_text(page_text)
-                
-                all_emails = emails_from_html.union(emails_from_text)
-                if len(all_emails) > 0:
-                    logger.info(f"重试后找到 {len(all_emails)} 个邮箱")
+                logger.debug("首次未找到邮箱，等待邮箱出现...")
+                winner = await self._wait_first(
+                    page.wait_for_function(_EMAIL_APPEARED_JS, timeout=2000),
+                    page.wait_for_load_state('networkidle', timeout=5000),
+                )
+                if winner is None:
+                    logger.debug("等待邮箱出现超时(这是正常的)")
+                else:
+                    # 重新获取内容
+                    all_emails = await self._extract_from_content(page)
+                    if len(all_emails) > 0:
+                        logger.info("重试后找到 %d 个邮箱", len(all_emails))
             
-            logger.info(f"本次提取找到 {len(all_emails)} 个邮箱")
+            logger.info("本次提取找到 %d 个邮箱", len(all_emails))
             
             return all_emails
         except Exception as e:
-            logger.error(f"页面提取失败: {str(e)}", exc_info=True)
+            logger.error("页面提取失败: %s", e)
             return set()
     
+    async def _fill_page_pool(self):
+        """为每个并发槽位预先创建一个页面, 跨 URL 复用, 只在 close() 时关闭"""
+        self._page_pool = asyncio.Queue(maxsize=self.max_concurrency)
+        for _ in range(self.max_concurrency):
+            pool_page = await self.context.new_page()
+            self._pages.append(pool_page)
+            self._page_pool.put_nowait(pool_page)
+    
+    async def _acquire_page(self, context) -> tuple:
+        """获取页面: 主上下文从页面池取出, 其他上下文 (如代理上下文) 新建页面
+
+        返回 (page, 是否来自页面池)
+        """
+        if context is self.context and self._page_pool is not None:
+            return await self._page_pool.get(), True
+        
+        page = await context.new_page()
+        self._pages.append(page)
+        return page, False
+    
+    async def _release_page(self, page, pooled: bool, replace: bool = False):
+        """归还页面池中的页面, 或关闭临时页面
+
+        归还前先跳转到 about:blank, 停止原页面的脚本和定时器并释放其内存;
+        replace 为 True 时 (页面处理出错) 或跳转失败时, 关闭该页面并用新页面补回页面池, 避免残留的 JS 状态影响后续 URL
+        """
+        if pooled:
+            if not replace:
+                try:
+                    await page.goto('about:blank')
+                except Exception as e:
+                    logger.debug("页面重置失败, 将替换该页面: %s", e)
+                    replace = True
+            if replace:
+                try:
+                    new_page = await self.context.new_page()
+                except Exception as e:
+                    # 新建失败时仍归还旧页面, 保证页面池大小不变, 否则等待页面的任务会一直阻塞
+                    logger.debug("替换页面失败, 继续使用原页面: %s", e)
+                    self._page_pool.put_nowait(page)
+                    return
+                self._pages.append(new_page)
+                self._page_pool.put_nowait(new_page)
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+                if page in self._pages:
+                    self._pages.remove(page)
+                return
+            self._page_pool.put_nowait(page)
+            return
+        
+        try:
+            await page.close()
+            if page in self._pages:
+                self._pages.remove(page)
+        except:
+            pass
+    
+    async def _get_proxy_context(self):
+        """获取 CAPTCHA 重试共用的代理上下文, 首次使用时创建"""
+        async with self._proxy_context_lock:
+            if self._proxy_context is None:
+                self._proxy_context = await self._create_context(use_proxy=True)
+                logger.info("✓ 已创建代理上下文")
+            return self._proxy_context
+    
+    async def _drop_proxy_context(self, proxy_context):
+        """丢弃不可用的代理上下文并标记其代理失败, 下次重试时重新创建"""
+        if self._proxy_context is not proxy_context:
+            return  # 已被其他任务丢弃
+        self._proxy_context = None
+        if self.current_proxy and self.proxy_manager:
+            self.proxy_manager.mark_proxy_failed(self.current_proxy['server'])
+            self.current_proxy = None
+        try:
+            await proxy_context.close()
+        except Exception as e:
+            logger.debug("关闭代理上下文出错: %s", e)
+    
     # 从单个URL提取邮箱,返回详细结果
     async def extract_from_url(self, url: str, callback=None, max_attempts: int = 2, context=None, url_prefix: str = "") -> dict:
-        """从单个URL提取邮箱，返回详细结果"""
+        """从单个URL提取邮箱，返回详细结果 (emails 为集合, 由调用方在最终输出时再转为列表)"""
         emails = set()
         visited_urls = set()
         page = None
+        pooled = False
         error_message = None
         error_type = None
         success = False
         last_error = None
+        needs_proxy_retry = False
         
         # 使用传入的 context 或默认 context
         current_context = context or self.context
@@ -376,7 +800,7 @@ class EmailExtractor:
                     logger.info("检测到停止信号,终止提取")
                     return {
                         'url': url,
-                        'emails': list(emails),
+                        'emails': emails,
                         'count': len(emails),
                         'success': False,
                         'error': '用户停止',
@@ -389,7 +813,7 @@ class EmailExtractor:
                     logger.error("浏览器上下文不存在,无法继续")
                     return {
                         'url': url,
-                        'emails': list(emails),
+                        'emails': emails,
                         'count': 0,
                         'success': False,
                         'error': '浏览器上下文不存在',
@@ -404,8 +828,7 @@ class EmailExtractor:
                 log_prefix = f"{url_prefix} " if url_prefix else ""
                 logger.info(f"{log_prefix}正在访问: {url} ({attempt_msg})")
                 
-                page = await current_context.new_page()
-                self._pages.append(page)
+                page, pooled = await self._acquire_page(current_context)
                 
                 # 获取超时设置,默认为 40000ms (40秒)
                 # 在 Render 等慢速环境中,较长的超时时间可以减少因网络波动导致的失败
@@ -415,27 +838,11 @@ class EmailExtractor:
                 logger.info(f"设置页面超时: {page_timeout}ms (尝试 {attempt + 1}/{max_attempts})")
                 page.set_default_timeout(page_timeout)
 
-                # 添加随机延迟
-                await asyncio.sleep(0.5 + (hash(url) % 10) / 10)
-
-                # 访问页面 - 使用更宽松的等待策略
-                # 移除 asyncio.wait_for,直接使用 Playwright 的 timeout,避免 Future exception was never retrieved 错误
-                await page.goto(url, wait_until='domcontentloaded', timeout=page_timeout)
+                # 访问页面 - 不等待网络空闲 (广告/统计脚本会拖慢数秒), 只等待邮箱相关内容出现
+                # 不使用 asyncio.wait_for,直接使用 Playwright 的 timeout,避免 Future exception was never retrieved 错误
+                await self._navigate(page, url, page_timeout)
                 
                 visited_urls.add(url)
-                
-                # 等待网络空闲 - 确保动态内容加载完成
-                try:
-                    logger.debug(f"等待网络空闲...")
-                    await page.wait_for_load_state('networkidle', timeout=10000)
-                    logger.debug(f"网络已空闲")
-                except Exception as e:
-                    logger.debug(f"网络空闲等待超时(这是正常的): {str(e)}")
-                
-                # 增加等待时间,让 JavaScript 有足够时间渲染内容
-                # 在生产环境中,资源受限可能导致 JS 执行较慢,但 3秒可能太长
-                await asyncio.sleep(1)
-
 
                 if callback:
                     log_msg = f"{url_prefix} 📄 页面加载完成: {url}" if url_prefix else f"📄 页面加载完成: {url}"
@@ -449,19 +856,7 @@ class EmailExtractor:
                     logger.info(f"最终URL: {page_url}")
                     
                     # 检测是否被重定向到验证码/机器人检测页面
-                    captcha_indicators = [
-                        'captcha', 'robot', 'challenge', 'verification',
-                        'security check', 'are you human', 'prove you',
-                        'sgcaptcha', 'cloudflare', 'recaptcha'
-                    ]
-                    
-                    page_title_lower = page_title.lower()
-                    page_url_lower = page_url.lower()
-                    
-                    is_captcha = any(
-                        indicator in page_title_lower or indicator in page_url_lower
-                        for indicator in captcha_indicators
-                    )
+                    is_captcha = _CAPTCHA_RE.search(page_title + ' ' + page_url) is not None
                     
                     if is_captcha:
                         error_message = f"网站启用了反爬虫验证 (CAPTCHA/Robot Challenge)"
@@ -470,15 +865,15 @@ class EmailExtractor:
                         logger.warning(f"{log_prefix}❌ {url} - {error_message}")
                         logger.warning(f"   检测到: 标题='{page_title}', URL包含验证码路径")
                         
-                        # 如果启用了代理回退且这是第一次尝试，触发重试
-                        if self.use_proxy_fallback and attempt == 0:
+                        # 如果启用了代理回退且还未使用代理，结束直连尝试，改用代理重试
+                        if self.use_proxy_fallback and context is None:
                             log_prefix = f"{url_prefix} " if url_prefix else ""
                             logger.info(f"{log_prefix}🔄 将使用代理重试: {url}")
                             if callback:
                                 log_msg = f"{url_prefix} 🔄 检测到CAPTCHA，将使用代理重试..." if url_prefix else "🔄 检测到CAPTCHA，将使用代理重试..."
                                 await callback('log', log_msg, 'warning')
-                            # 抛出异常触发重试
-                            raise Exception("CAPTCHA_DETECTED_RETRY_WITH_PROXY")
+                            needs_proxy_retry = True
+                            break
                         else:
                             # 已经用过代理或未启用代理回退，直接失败
                             if callback:
@@ -487,7 +882,7 @@ class EmailExtractor:
                             
                             return {
                                 'url': url,
-                                'emails': [],
+                                'emails': set(),
                                 'count': 0,
                                 'success': False,
                                 'error': error_message,
@@ -496,7 +891,7 @@ class EmailExtractor:
                             }
                     
                 except Exception as e:
-                    logger.debug(f"获取页面信息失败: {e}")
+                    logger.debug("获取页面信息失败: %s", e)
 
                 # 提取邮箱
                 current_emails = await self._extract_from_page(page)
@@ -505,10 +900,10 @@ class EmailExtractor:
                 if current_emails and callback:
                     log_msg = f"{url_prefix} 📧 从当前页面提取到 {len(current_emails)} 个邮箱" if url_prefix else f"📧 从当前页面提取到 {len(current_emails)} 个邮箱"
                     await callback('log', log_msg, 'success')
-                    await callback('email', list(emails))
+                    await callback('email', list(current_emails))
 
-                # 尝试英文版
-                if not self.stopped:
+                # 当前页面没有邮箱时才尝试英文版, 已有结果时省去一次完整的页面加载
+                if not emails and not self.stopped:
                     english_url = await self._find_english_link(page)
                     if english_url and english_url not in visited_urls and '/en/' not in url:
                         if callback:
@@ -519,9 +914,8 @@ class EmailExtractor:
                             # 注意：这里重新获取 page_timeout 是为了安全，虽然上面已经获取过了，但为了保持局部变量清晰
                             page_timeout = int(os.getenv("PAGE_TIMEOUT", "40000"))
                             english_timeout = max(10000, page_timeout // 2)
-                            await page.goto(english_url, wait_until='domcontentloaded', timeout=english_timeout)
+                            await self._navigate(page, english_url, english_timeout)
                             visited_urls.add(english_url)
-                            await asyncio.sleep(2)
                             
                             english_page_emails = await self._extract_from_page(page)
                             new_emails = english_page_emails - emails
@@ -530,7 +924,7 @@ class EmailExtractor:
                                 if callback:
                                     log_msg = f"{url_prefix} 📧 从英文版额外提取到 {len(new_emails)} 个邮箱" if url_prefix else f"📧 从英文版额外提取到 {len(new_emails)} 个邮箱"
                                     await callback('log', log_msg, 'success')
-                                    await callback('email', list(emails))
+                                    await callback('email', list(new_emails))
                         except Exception as e:
                             logger.warning(f"访问英文版失败: {str(e)}")
 
@@ -540,7 +934,7 @@ class EmailExtractor:
                     log_msg = f"{url_prefix} ✅ 重试成功 (第 {attempt + 1} 次尝试)" if url_prefix else f"✅ 重试成功 (第 {attempt + 1} 次尝试)"
                     await callback('log', log_msg, 'success')
                 # No break here, the finally block will handle the return on success
-            except PlaywrightTimeout as e:
+            except self._PlaywrightTimeout as e:
                 error_message = f"页面加载超时: {str(e)}"
                 last_error = error_message
                 error_type, should_retry, retry_delay = self._categorize_error(error_message)
@@ -576,39 +970,6 @@ class EmailExtractor:
                     log_msg = f"{url_prefix} ❌ 错误: {url[:50]}... - {error_type} (尝试 {attempt + 1}/{max_attempts})" if url_prefix else f"❌ 错误: {url[:50]}... - {error_type} (尝试 {attempt + 1}/{max_attempts})"
                     await callback('log', log_msg, 'error')
                 
-                # 如果是 CAPTCHA 触发的代理重试
-                if "CAPTCHA_DETECTED_RETRY_WITH_PROXY" in error_message and attempt == 0:
-                    log_prefix = f"{url_prefix} " if url_prefix else ""
-                    logger.info(f"{log_prefix}🔄 检测到CAPTCHA，准备使用代理重试...")
-                    
-                    # 创建临时代理上下文
-                    proxy_context = None
-                    try:
-                        proxy_context = await self._create_context(use_proxy=True)
-                        log_prefix = f"{url_prefix} " if url_prefix else ""
-                        logger.info(f"{log_prefix}✓ 已创建临时代理上下文，重新尝试...")
-                        if callback:
-                            log_msg = f"{url_prefix} ✓ 已切换到代理模式，重新尝试..." if url_prefix else "✓ 已切换到代理模式，重新尝试..."
-                            await callback('log', log_msg, 'info')
-                        
-                        # 递归调用，使用新的上下文
-                        # 注意：这里我们只重试一次 (max_attempts=1)，或者根据需要调整
-                        retry_result = await self.extract_from_url(url, callback, max_attempts=max_attempts, context=proxy_context, url_prefix=url_prefix)
-                        return retry_result
-                        
-                    except Exception as retry_error:
-                        logger.error(f"使用代理重试失败: {retry_error}")
-                        error_message = f"代理重试失败: {str(retry_error)}"
-                        error_type = 'PROXY_RETRY_FAILED'
-                        break # 代理重试失败，直接跳出
-                    finally:
-                        # 确保关闭临时上下文
-                        if proxy_context:
-                            try:
-                                await proxy_context.close()
-                            except:
-                                pass
-                
                 # 如果还有重试机会且错误可重试
                 if attempt < max_attempts - 1 and should_retry:
                     log_prefix = f"{url_prefix} " if url_prefix else ""
@@ -626,14 +987,10 @@ class EmailExtractor:
                     break
             
             finally:
-                # 关闭页面
+                # 归还或关闭页面, 出错的页面从页面池中替换掉
                 if page:
-                    try:
-                        await page.close()
-                        if page in self._pages:
-                            self._pages.remove(page)
-                    except:
-                        pass
+                    await self._release_page(page, pooled, replace=not success)
+                    page = None
                 
                 # 如果成功提取到邮箱，立即返回
                 if success:
@@ -641,7 +998,7 @@ class EmailExtractor:
                     logger.info(f"{log_prefix}✅ 成功从 {url} 提取到 {len(emails)} 个邮箱 (尝试 {attempt + 1}/{max_attempts})")
                     return {
                         'url': url,
-                        'emails': list(emails),
+                        'emails': emails,
                         'count': len(emails),
                         'success': True,
                         'error': None,
@@ -649,6 +1006,35 @@ class EmailExtractor:
                         'attempts': attempt + 1
                     }
     
+        # CAPTCHA 触发的代理重试: 在共用的代理上下文中只再尝试一次
+        if needs_proxy_retry:
+            proxy_context = None
+            try:
+                proxy_context = await self._get_proxy_context()
+                log_prefix = f"{url_prefix} " if url_prefix else ""
+                logger.info(f"{log_prefix}✓ 已切换到代理上下文，重新尝试...")
+                if callback:
+                    log_msg = f"{url_prefix} ✓ 已切换到代理模式，重新尝试..." if url_prefix else "✓ 已切换到代理模式，重新尝试..."
+                    await callback('log', log_msg, 'info')
+                
+                # 传入 context 后不会再次触发代理重试
+                proxy = self.current_proxy
+                start = time.monotonic()
+                retry_result = await self.extract_from_url(url, callback, max_attempts=1, context=proxy_context, url_prefix=url_prefix)
+                # 成功时记录耗时, 供代理管理器按响应时间加权选择
+                if retry_result['success'] and proxy and self.proxy_manager:
+                    self.proxy_manager.mark_proxy_success(proxy['server'], time.monotonic() - start)
+                # 代理本身不可用时丢弃该上下文, 下次重试换一个代理
+                elif not retry_result['success'] and retry_result['error_type'] in ('NETWORK_ERROR', 'TIMEOUT_ERROR'):
+                    await self._drop_proxy_context(proxy_context)
+                return retry_result
+            except Exception as retry_error:
+                logger.error(f"使用代理重试失败: {retry_error}")
+                error_message = f"代理重试失败: {str(retry_error)}"
+                error_type = 'PROXY_RETRY_FAILED'
+                if proxy_context:
+                    await self._drop_proxy_context(proxy_context)
+        
         # 所有尝试都失败了
         final_error = last_error or error_message or '未知错误'
         log_prefix = f"{url_prefix} " if url_prefix else ""
@@ -661,7 +1047,7 @@ class EmailExtractor:
         
         return {
             'url': url,
-            'emails': list(emails),
+            'emails': emails,
             'count': len(emails),
             'success': False,
             'error': final_error,
@@ -682,8 +1068,8 @@ class EmailExtractor:
         for url in urls:
             # 简单的归一化: 去除协议, www, 尾部斜杠
             normalized = url.lower().strip()
-            normalized = re.sub(r'^https?://', '', normalized)
-            normalized = re.sub(r'^www\.', '', normalized)
+            normalized = _URL_SCHEME_RE.sub('', normalized)
+            normalized = _URL_WWW_RE.sub('', normalized)
             normalized = normalized.rstrip('/')
             
             if normalized not in url_groups:
@@ -741,10 +1127,12 @@ class EmailExtractor:
         
         start_time = time.time()
         
-        # 限制并发数 - 从环境变量获取，默认为 3 (适合 Render 等容器环境)
-        max_concurrency = int(os.getenv("MAX_CONCURRENCY", "3"))
-        logger.info(f"并发限制: {max_concurrency}")
-        sem = asyncio.Semaphore(max_concurrency)
+        # 限制并发数
+        logger.info(f"并发限制: {self.max_concurrency}")
+        
+        # 页面池通常已在 initialize() 中创建
+        if self._page_pool is None:
+            await self._fill_page_pool()
         
         # 进度计数器
         completed_count = 0
@@ -757,68 +1145,75 @@ class EmailExtractor:
             url_number = index + 1
             url_prefix = f"[{url_number}/{total}]"
             
-            async with sem:
-                # 检查暂停/停止
-                while self.paused and not self.stopped:
-                    await asyncio.sleep(0.5)
-                
-                if self.stopped:
-                    return
-                
-                logger.info(f"📊 {url_prefix} 开始处理: {url}")
-                if callback:
-                    await callback('log', f"🔍 {url_prefix} 正在处理: {url[:50]}...", 'info')
+            # 检查暂停/停止
+            await self._resume_event.wait()
+            
+            if self.stopped:
+                return
+            
+            logger.info(f"📊 {url_prefix} 开始处理: {url}")
+            if callback:
+                await callback('log', f"🔍 {url_prefix} 正在处理: {url[:50]}...", 'info')
+            
+            try:
+                result = await self.extract_from_url(url, callback, url_prefix=url_prefix)
                 
-                try:
-                    result = await self.extract_from_url(url, callback, url_prefix=url_prefix)
+                async with results_lock:
+                    # 更新总邮箱列表
+                    all_emails.update(result['emails'])
                     
-                    async with results_lock:
-                        # 更新总邮箱列表
-                        all_emails.update(result['emails'])
-                        
-                        # 跟踪失败和无邮箱的URL
-                        if not result['success']:
-                            failed_urls.append({
-                                'url': url,
-                                'error': result['error'] or '未知错误',
-                                'timestamp': time.time()
-                            })
-                            if callback:
-                                await callback('log', f"❌ {url_prefix} 失败: {result['error'][:50]}...", 'error')
-                        elif result['count'] == 0:
-                            no_email_urls.append({
-                                'url': url,
-                                'timestamp': time.time()
-                            })
-                            if callback:
-                                await callback('log', f"⚠️ {url_prefix} 未提取到邮箱", 'warning')
-                        else:
-                            if callback:
-                                await callback('log', f"✅ {url_prefix} 成功提取 {result['count']} 个邮箱", 'success')
-                except Exception as e:
-                    logger.error(f"{url_prefix} 处理 {url} 时出错: {e}")
-                    async with results_lock:
+                    # 跟踪失败和无邮箱的URL
+                    if not result['success']:
                         failed_urls.append({
                             'url': url,
-                            'error': str(e),
+                            'error': result['error'] or '未知错误',
                             'timestamp': time.time()
                         })
-                    if callback:
-                        await callback('log', f"❌ {url_prefix} 跳过: {str(e)}", 'error')
-                finally:
-                    # 更新进度
-                    async with progress_lock:
-                        completed_count += 1
-                        current_progress = int(completed_count / total * 100)
-                    
-                    if callback:
-                        await callback('progress', current_progress)
+                        if callback:
+                            await callback('log', f"❌ {url_prefix} 失败: {result['error'][:50]}...", 'error')
+                    elif result['count'] == 0:
+                        no_email_urls.append({
+                            'url': url,
+                            'timestamp': time.time()
+                        })
+                        if callback:
+                            await callback('log', f"⚠️ {url_prefix} 未提取到邮箱", 'warning')
+                    else:
+                        if callback:
+                            await callback('log', f"✅ {url_prefix} 成功提取 {result['count']} 个邮箱", 'success')
+            except Exception as e:
+                logger.error(f"{url_prefix} 处理 {url} 时出错: {e}")
+                async with results_lock:
+                    failed_urls.append({
+                        'url': url,
+                        'error': str(e),
+                        'timestamp': time.time()
+                    })
+                if callback:
+                    await callback('log', f"❌ {url_prefix} 跳过: {str(e)}", 'error')
+            finally:
+                # 更新进度
+                async with progress_lock:
+                    completed_count += 1
+                    current_progress = int(completed_count / total * 100)
                 
-        # 创建任务列表
-        tasks = [process_url(i, url) for i, url in enumerate(urls)]
+                if callback:
+                    await callback('progress', current_progress)
+            
+        # 待处理队列: 固定数量的 worker 依次取出 URL, worker 数即并发上限
+        queue = asyncio.Queue()
+        for item in enumerate(urls):
+            queue.put_nowait(item)
+        
+        async def worker():
+            while not queue.empty():
+                # 已停止时不再取新的 URL
+                if self.stopped:
+                    return
+                index, url = queue.get_nowait()
+                await process_url(index, url)
         
-        # 运行所有任务
-        await asyncio.gather(*tasks)
+        await asyncio.gather(*(worker() for _ in range(min(self.max_concurrency, total))))
         
         # 发送统计信息
         if callback:
@@ -847,17 +1242,20 @@ class EmailExtractor:
     def pause(self):
         """暂停提取"""
         self.paused = True
+        self._resume_event.clear()
         logger.info("提取已暂停")
     
     def resume(self):
         """继续提取"""
         self.paused = False
+        self._resume_event.set()
         logger.info("提取已继续")
     
     def stop(self):
         """停止提取"""
         self.stopped = True
         self.paused = False
+        self._resume_event.set()
         logger.info("提取已停止")
     
     async def close(self):
@@ -876,15 +1274,27 @@ class EmailExtractor:
                     try:
                         if not page.is_closed():
                             await asyncio.wait_for(page.close(), timeout=5.0)
-                            logger.debug(f"页面已关闭")
+                            logger.debug("页面已关闭")
                     except asyncio.TimeoutError:
                         logger.warning(f"关闭页面超时")
                     except Exception as e:
                         logger.warning(f"关闭页面出错: {e}")
                 self._pages.clear()
                 logger.info("所有页面已关闭")
+            self._page_pool = None
             
             # 2. 关闭上下文
+            if self._proxy_context:
+                try:
+                    await asyncio.wait_for(self._proxy_context.close(), timeout=10.0)
+                    logger.info("代理上下文已关闭")
+                except asyncio.TimeoutError:
+                    logger.warning("关闭代理上下文超时")
+                except Exception as e:
+                    logger.warning(f"关闭代理上下文时出错: {e}")
+                finally:
+                    self._proxy_context = None
+            
             if self.context:
                 try:
                     await asyncio.wait_for(self.context.close(), timeout=10.0)
@@ -923,9 +1333,7 @@ class EmailExtractor:
             # 5. 重置状态
             self.stopped = False
             self.paused = False
-            
-            # 6. 等待资源完全释放
-            await asyncio.sleep(1.0)  # 增加到1秒确保完全释放
+            self._resume_event.set()
             
             logger.info("浏览器资源已完全释放")
             
@@ -2,30 +2,49 @@
 免费代理管理器
 从免费代理列表中轮换使用代理
 """
+import asyncio
+import atexit
+import bisect
+import json
+import os
 import random
 import logging
-from typing import Optional, Dict, List
+import time
+from functools import lru_cache
+from itertools import accumulate
+from types import MappingProxyType
+from typing import Optional, Dict, List, Mapping, Tuple
 
 logger = logging.getLogger(__name__)
 
+# 失败代理的持久化: 由环境变量 PROXY_STATE_FILE 指定文件路径 (未设置则不持久化),
+# 文件内容为 {代理地址: 标记失败的时间戳}, 重启后无需重新探测已知失效的代理;
+# 每条记录按各自的失败时间计算, 超过 PROXY_FAILED_TTL 秒即过期
+_FLUSH_DELAY = 5.0  # 位图变化后延迟写盘的秒数, 期间的多次变化合并为一次写入
+
 class FreeProxyManager:
     """免费代理管理器"""
     
     # 免费代理列表（从 https://www.proxy-list.download/ 获取）
-    # 格式: {"server": "http://ip:port"}
-    FREE_PROXIES = [
-        {"server": "http://38.252.213.67:999"},       # Peru
-        {"server": "http://199.217.99.123:2525"},     # United States
-        {"server": "http://195.158.8.123:3128"},      # Uzbekistan
-        {"server": "http://35.209.198.222:80"},       # United States
-        {"server": "http://156.38.112.11:80"},        # Ghana
-        {"server": "http://185.99.70.146:8080"},      # Czech Republic
-        {"server": "http://154.65.39.7:80"},          # Senegal
-        {"server": "http://138.124.49.149:10808"},    # Sweden
-        {"server": "http://35.197.89.213:80"},        # United States
-        {"server": "http://162.240.19.30:80"},        # United States
-        {"server": "http://210.223.44.230:3128"},     # South Korea
-    ]
+    # 按下标并行存放: _SERVERS[i] 是地址, _CONFIGS[i] 是传给 Playwright 的配置 {"server": "http://ip:port"}
+    # _CONFIGS 中的配置是只读映射, 误写会抛 TypeError; 传给 Playwright 前需用 dict() 复制
+    _SERVERS: Tuple[str, ...] = (
+        "http://38.252.213.67:999",       # Peru
+        "http://199.217.99.123:2525",     # United States
+        "http://195.158.8.123:3128",      # Uzbekistan
+        "http://35.209.198.222:80",       # United States
+        "http://156.38.112.11:80",        # Ghana
+        "http://185.99.70.146:8080",      # Czech Republic
+        "http://154.65.39.7:80",          # Senegal
+        "http://138.124.49.149:10808",    # Sweden
+        "http://35.197.89.213:80",        # United States
+        "http://162.240.19.30:80",        # United States
+        "http://210.223.44.230:3128",     # South Korea
+    )
+    _CONFIGS: Tuple[Mapping[str, str], ...] = tuple(MappingProxyType({"server": server}) for server in _SERVERS)
+    _SERVER_TO_IDX: Dict[str, int] = {server: i for i, server in enumerate(_SERVERS)}
+    _ALL_MASK = (1 << len(_SERVERS)) - 1
+    _EWMA_ALPHA = 0.2  # 响应时间/成功率的指数滑动平均系数
     
     def __init__(self, use_proxy: bool = True):
         """
@@ -35,67 +54,166 @@ class FreeProxyManager:
             use_proxy: 是否使用代理（False 则直连）
         """
         self.use_proxy = use_proxy
-        self.current_index = 0
-        self.failed_proxies = set()  # 记录失败的代理
+        self._state_file = os.getenv("PROXY_STATE_FILE") or None
+        self._state_ttl = float(os.getenv("PROXY_FAILED_TTL", "3600"))
+        self._failed_at: Dict[int, float] = {}  # 失败代理下标 -> 标记失败的时间戳, 与 failed_mask 同步
+        self.failed_mask = self._load_failed_mask()  # 失败代理的位图, 第 i 位对应 _SERVERS[i]
+        self._available = list(range(len(self._SERVERS)))  # 可用代理下标, 与 failed_mask 同步
+        self._dirty = self.failed_mask != 0  # failed_mask 变化后, 下次取代理时才重建 _available
+        self._flush_task = None  # 等待写盘的后台任务
+        self._pending_flush = False  # 有尚未写盘的变化
+        # 每个代理的 (ewma_latency 秒, ewma_success), 用于加权轮换
+        self._stats: List[Tuple[float, float]] = [(1.0, 1.0)] * len(self._SERVERS)
+        self._cum_weights: List[float] = []  # _available 对应的累积权重
+        self._stats_dirty = True  # _stats 或 _available 变化后, 下次取代理时才重建 _cum_weights
+        
+        if self._state_file:
+            # 进程退出时写入最后一次延迟写盘前的变化
+            atexit.register(self.flush)
         
         if use_proxy:
-            logger.info(f"✓ 代理管理器已启用，共 {len(self.FREE_PROXIES)} 个代理")
+            logger.info(f"✓ 代理管理器已启用，共 {len(self._SERVERS)} 个代理")
         else:
             logger.info("⚠ 代理管理器已禁用，使用直连")
     
-    def get_next_proxy(self) -> Optional[Dict]:
-        """
-        获取下一个可用代理
-        
-        Returns:
-            代理配置字典，如果不使用代理则返回 None
+    def _load_failed_mask(self) -> int:
+        """从状态文件恢复未过期的失败代理记录并返回位图; 未配置、不存在或内容无效时返回 0"""
+        if not self._state_file:
+            return 0
+        try:
+            with open(self._state_file) as f:
+                records = json.load(f)
+            expire_before = time.time() - self._state_ttl
+            mask = 0
+            for server, failed_at in records.items():
+                idx = self._SERVER_TO_IDX.get(server)
+                # 已从列表移除的代理和超过 TTL 的记录直接丢弃
+                if idx is not None and failed_at >= expire_before:
+                    self._failed_at[idx] = failed_at
+                    mask |= 1 << idx
+        except (OSError, ValueError, AttributeError, TypeError):
+            self._failed_at.clear()
+            return 0
+        if mask:
+            logger.info(f"已恢复 {len(self._failed_at)} 个失败代理记录")
+        return mask
+    
+    def _write_failed_mask(self):
+        """原子写入失败代理记录 (先写临时文件再 os.replace, 不会留下写了一半的文件)
+
+        写入失败 (如目录不可写) 时停用持久化, 不再重试
         """
-        if not self.use_proxy:
-            return None
-        
-        # 过滤掉已失败的代理
-        available_proxies = [
-            p for p in self.FREE_PROXIES 
-            if p["server"] not in self.failed_proxies
-        ]
-        
-        if not available_proxies:
+        if not self._state_file:
+            return
+        self._pending_flush = False
+        tmp = self._state_file + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({self._SERVERS[i]: t for i, t in self._failed_at.items()}, f)
+            os.replace(tmp, self._state_file)
+        except OSError as e:
+            logger.warning(f"保存失败代理记录出错, 停用持久化: {e}")
+            self._state_file = None
+    
+    async def _flush_later(self):
+        """延迟 _FLUSH_DELAY 秒后写盘"""
+        await asyncio.sleep(_FLUSH_DELAY)
+        self._flush_task = None
+        self.flush()
+    
+    def flush(self):
+        """立即写入尚未写盘的变化 (延迟写盘到期、重置失败列表和进程退出时调用)"""
+        if self._pending_flush:
+            self._write_failed_mask()
+    
+    def _schedule_flush(self):
+        """failed_mask 变化后安排一次后台写盘; 没有运行中的事件循环时直接写入"""
+        if not self._state_file:
+            return
+        self._pending_flush = True
+        if self._flush_task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_failed_mask()
+            return
+        self._flush_task = loop.create_task(self._flush_later())
+    
+    def _get_available(self) -> List[int]:
+        """返回可用代理下标列表, 只在有代理被标记失败后才重新过滤"""
+        if self.failed_mask == self._ALL_MASK:
             logger.warning("所有代理都已失败，重置失败列表")
-            self.failed_proxies.clear()
-            available_proxies = self.FREE_PROXIES
+            self.failed_mask = 0
+            self._failed_at.clear()
+            self._dirty = True
+            self._schedule_flush()
         
-        # 轮换选择
-        proxy = available_proxies[self.current_index % len(available_proxies)]
-        self.current_index += 1
+        if self._dirty:
+            # 只遍历未失败 (未置位) 的下标, 每次取出最低位的 1
+            mask = ~self.failed_mask & self._ALL_MASK
+            available = []
+            while mask:
+                low = mask & -mask
+                available.append(low.bit_length() - 1)
+                mask ^= low
+            self._available = available
+            self._dirty = False
+            self._stats_dirty = True
         
-        logger.debug(f"使用代理: {proxy['server']}")
-        return proxy
+        return self._available
     
-    def get_random_proxy(self) -> Optional[Dict]:
+    def get_next_proxy(self) -> Optional[Mapping[str, str]]:
         """
-        随机获取一个可用代理
+        按权重获取下一个可用代理 (响应快、成功率高的代理被选中的概率更大)
         
         Returns:
-            代理配置字典，如果不使用代理则返回 None
+            只读的代理配置映射，如果不使用代理则返回 None
         """
         if not self.use_proxy:
             return None
         
-        # 过滤掉已失败的代理
-        available_proxies = [
-            p for p in self.FREE_PROXIES 
-            if p["server"] not in self.failed_proxies
-        ]
+        available_proxies = self._get_available()
         
-        if not available_proxies:
-            logger.warning("所有代理都已失败，重置失败列表")
-            self.failed_proxies.clear()
-            available_proxies = self.FREE_PROXIES
+        if self._stats_dirty:
+            # 权重 w_i = success_i / (latency_i + 0.1)
+            stats = self._stats
+            self._cum_weights = list(accumulate(
+                stats[i][1] / (stats[i][0] + 0.1) for i in available_proxies
+            ))
+            self._stats_dirty = False
+        
+        # 按累积权重二分查找
+        cum = self._cum_weights
+        pos = bisect.bisect(cum, random.random() * cum[-1])
+        proxy = self._CONFIGS[available_proxies[min(pos, len(cum) - 1)]]
         
-        proxy = random.choice(available_proxies)
-        logger.debug(f"随机选择代理: {proxy['server']}")
+        logger.debug("使用代理: %s", proxy['server'])
         return proxy
     
+    def _update_stats(self, idx: int, latency: Optional[float], success: float):
+        """用 EWMA 更新代理的响应时间 (latency 为 None 时保持不变) 和成功率"""
+        alpha = self._EWMA_ALPHA
+        old_latency, old_success = self._stats[idx]
+        if latency is not None:
+            old_latency += alpha * (latency - old_latency)
+        self._stats[idx] = (old_latency, old_success + alpha * (success - old_success))
+        self._stats_dirty = True
+    
+    def mark_proxy_success(self, proxy_server: str, latency: float):
+        """
+        记录代理请求成功及其耗时
+        
+        Args:
+            proxy_server: 代理服务器地址
+            latency: 本次请求耗时 (秒)
+        """
+        idx = self._SERVER_TO_IDX.get(proxy_server)
+        if idx is None:
+            return
+        self._update_stats(idx, latency, 1.0)
+        logger.debug("代理成功: %s (%.2fs)", proxy_server, latency)
+    
     def mark_proxy_failed(self, proxy_server: str):
         """
         标记代理为失败
@@ -103,13 +221,35 @@ class FreeProxyManager:
         Args:
             proxy_server: 代理服务器地址，例如 "http://38.252.213.67:999"
         """
-        self.failed_proxies.add(proxy_server)
-        logger.warning(f"标记代理失败: {proxy_server} (已失败: {len(self.failed_proxies)}/{len(self.FREE_PROXIES)})")
+        idx = self._SERVER_TO_IDX.get(proxy_server)
+        if idx is None:
+            logger.warning(f"未知代理, 忽略: {proxy_server}")
+            return
+        
+        self._update_stats(idx, None, 0.0)
+        bit = 1 << idx
+        if not self.failed_mask & bit:
+            self.failed_mask |= bit
+            self._failed_at[idx] = time.time()
+            self._dirty = True
+            self._schedule_flush()
+        logger.warning(f"标记代理失败: {proxy_server} (已失败: {self._failed_count()}/{len(self._SERVERS)})")
+    
+    def _failed_count(self) -> int:
+        """失败代理数 (位图中 1 的个数)"""
+        return bin(self.failed_mask).count('1')
     
     def reset_failed_proxies(self):
         """重置失败代理列表"""
-        count = len(self.failed_proxies)
-        self.failed_proxies.clear()
+        count = self._failed_count()
+        self.failed_mask = 0
+        self._failed_at.clear()
+        self._available = list(range(len(self._SERVERS)))
+        self._dirty = False
+        self._stats_dirty = True
+        # 手动重置立即写盘, 不依赖延迟写盘
+        self._schedule_flush()
+        self.flush()
         logger.info(f"已重置 {count} 个失败代理")
     
     def get_stats(self) -> Dict:
@@ -119,8 +259,8 @@ class FreeProxyManager:
         Returns:
             统计信息字典
         """
-        total = len(self.FREE_PROXIES)
-        failed = len(self.failed_proxies)
+        total = len(self._SERVERS)
+        failed = self._failed_count()
         available = total - failed
         
         return {
@@ -131,20 +271,22 @@ class FreeProxyManager:
         }
 
 
-# 全局代理管理器实例
-_proxy_manager = None
+@lru_cache(maxsize=1)
+def _shared_proxy_manager() -> FreeProxyManager:
+    """全局唯一的代理管理器 (无参数, lru_cache 只会缓存这一个实例)"""
+    return FreeProxyManager()
+
 
 def get_proxy_manager(use_proxy: bool = True) -> FreeProxyManager:
     """
     获取全局代理管理器实例
     
     Args:
-        use_proxy: 是否使用代理
+        use_proxy: 是否使用代理 (应用到共享实例上)
     
     Returns:
         代理管理器实例
     """
-    global _proxy_manager
-    if _proxy_manager is None:
-        _proxy_manager = FreeProxyManager(use_proxy=use_proxy)
-    return _proxy_manager
+    manager = _shared_proxy_manager()
+    manager.use_proxy = use_proxy
+    return manager
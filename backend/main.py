@@ -1,9 +1,8 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from email_extractor import EmailExtractor
-import json
+import orjson
 import asyncio
-from typing import Dict
 import os
 import logging
 from dotenv import load_dotenv
@@ -31,38 +30,96 @@ app.add_middleware(CORSMiddleware,
     allow_headers=["*"],
 )
 
-# 存储活动的提取任务
-active_extractors: Dict[str, EmailExtractor] = {}
-active_tasks: Dict[str, asyncio.Task] = {}
+# 提取器与任务直接挂在 websocket.state 上, 这里只记录活动 session 数
+_active_count = 0
 
-async def cleanup_extractor(session_id: str, extractor: EmailExtractor):
-    """安全清理提取器实例"""
+# 按消息类型构建 WebSocket 消息, 只包含该类型需要的字段
+_BUILDERS = {
+    'log': lambda data, level: {'type': 'log', 'message': data, 'level': level},
+    'email': lambda data, _: {'type': 'email', 'emails': data},
+    'progress': lambda data, _: {'type': 'progress', 'progress': data},
+    'failed_urls': lambda data, _: {'type': 'failed_urls', 'failed_urls': data},
+    'no_email_urls': lambda data, _: {'type': 'no_email_urls', 'no_email_urls': data},
+    'deduplicated_urls': lambda data, _: {'type': 'deduplicated_urls', 'deduplicated_urls': data},
+}
+
+# 每个连接的待发送消息队列上限, 以及单帧最多合并的消息数
+_SEND_QUEUE_SIZE = 256
+_SEND_BATCH_SIZE = 16
+
+# 队列中代表 "最新进度" 的占位符, 发送时才取出 websocket.state.progress 的当前值
+_PROGRESS = object()
+
+async def _send(websocket: WebSocket, message: dict):
+    """将消息放入该连接的发送队列, 由 _flush_messages 合并发送
+
+    progress 消息只保留最新值: 队列中最多一个进度占位符, 之后的进度直接覆盖待发送的值,
+    不会丢失最后一次 (100%) 进度; 其余消息在队列满时等待腾出空间
+    """
+    state = websocket.state
+    if message['type'] == 'progress':
+        pending = state.progress is not None
+        state.progress = message
+        if pending:
+            return
+        message = _PROGRESS
+    await state.send_queue.put(message)
+
+async def _flush_messages(websocket: WebSocket):
+    """后台发送协程: 把队列中已积压的消息合并为一个 JSON 数组, 以一个二进制帧发送"""
+    state = websocket.state
+    queue = state.send_queue
+    while True:
+        items = [await queue.get()]
+        while not queue.empty() and len(items) < _SEND_BATCH_SIZE:
+            items.append(queue.get_nowait())
+        if _PROGRESS in items:
+            items[items.index(_PROGRESS)] = state.progress
+            state.progress = None
+        try:
+            await websocket.send_bytes(orjson.dumps(items))
+        except Exception as e:
+            # 连接已断开时继续取出并丢弃, 避免 _send 阻塞在满队列上
+            logger.debug("发送消息失败: %s", e)
+        finally:
+            # 供 _drain_messages 的 queue.join() 判断已发送完毕
+            for _ in items:
+                queue.task_done()
+
+async def _drain_messages(websocket: WebSocket, flusher: asyncio.Task, timeout: float = 2.0):
+    """等待队列中的消息全部发出 (最后一次 send_bytes 完成) 后再停止发送协程, 超时则直接停止"""
+    try:
+        await asyncio.wait_for(websocket.state.send_queue.join(), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.debug("等待消息发送超时, 丢弃剩余消息")
+    finally:
+        flusher.cancel()
+
+async def cleanup_extractor(websocket: WebSocket):
+    """安全清理 websocket 上绑定的提取器实例 (重复调用时直接返回)"""
+    global _active_count
+    state = websocket.state
+    extractor, task = state.extractor, state.task
+    if extractor is None:
+        return
+    # 先解绑, 被取消任务的 finally 再次调用时即可直接返回
+    state.extractor = state.task = None
+    _active_count -= 1
+    session_id = str(id(websocket))
     try:
         logger.info(f"开始清理 session {session_id} 的浏览器实例...")
         
-        # 取消正在运行的任务
-        if session_id in active_tasks:
-            task = active_tasks[session_id]
-            if not task.done():
-                task.cancel()
-                try:
-                    await task
-                except asyncio.CancelledError:
-                    logger.info(f"任务 {session_id} 已取消")
-            del active_tasks[session_id]
+        # 取消正在运行的任务 (任务自身收尾调用时不能等待自己)
+        if task is not None and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                logger.info(f"任务 {session_id} 已取消")
         
         # 关闭提取器
-        if extractor:
-            await extractor.close()
-            logger.info(f"Extractor {session_id} 已关闭")
-        
-        # 从活动列表移除
-        if session_id in active_extractors:
-            del active_extractors[session_id]
-            logger.info(f"已从活动列表移除 {session_id}")
-        
-        # 额外等待确保资源释放
-        await asyncio.sleep(0.5)
+        await extractor.close()
+        logger.info(f"Extractor {session_id} 已关闭")
         
     except Exception as e:
         logger.error(f"清理 extractor 时出错: {e}", exc_info=True)
@@ -71,7 +128,7 @@ async def cleanup_extractor(session_id: str, extractor: EmailExtractor):
 async def get_config():
     """获取配置信息"""
     return {
-        "fake_email_prefixes": EmailExtractor.FAKE_EMAIL_PREFIXES
+        "fake_email_prefixes": sorted(EmailExtractor.FAKE_EMAIL_PREFIXES)
     }
 
 @app.get("/api/health")
@@ -79,142 +136,152 @@ async def health_check():
     """健康检查"""
     return {
         "status": "ok",
-        "active_sessions": len(active_extractors),
+        "active_sessions": _active_count,
         "use_proxy": USE_PROXY,
         "proxy_mode": "smart_fallback" if USE_PROXY else "disabled"
     }
 
+async def _handle_start(websocket: WebSocket, ext: EmailExtractor, message: dict):
+    """创建提取器并在后台开始提取"""
+    global _active_count
+    session_id = str(id(websocket))
+    
+    # 如果已有运行中的实例,先清理
+    if ext is not None:
+        logger.warning(f"检测到 {session_id} 已有运行实例,先清理...")
+        await cleanup_extractor(websocket)
+    
+    urls = message.get('urls', [])
+    # show_browser = message.get('showBrowser', True)
+    show_browser = False
+    
+    logger.info(f"创建新的提取器实例: {session_id}, headless={not show_browser}, use_proxy_fallback={USE_PROXY}")
+    
+    # 创建新提取器（启用智能代理回退）
+    extractor = EmailExtractor(headless=not show_browser, use_proxy=USE_PROXY)
+    websocket.state.extractor = extractor
+    _active_count += 1
+    
+    try:
+        await extractor.initialize()
+        
+        logger.info(f"提取器初始化成功: {session_id}")
+        
+        # 回调函数
+        async def send_callback(msg_type, data, level='info'):
+            try:
+                await _send(websocket, _BUILDERS[msg_type](data, level))
+            except Exception as e:
+                logger.error(f"发送消息失败: {e}")
+        
+        # 创建提取任务
+        async def run_extraction():
+            try:
+                await extractor.extract_from_urls(urls, send_callback)
+                await _send(websocket, {
+                    'type': 'complete',
+                    'message': '所有任务处理完毕'
+                })
+            except asyncio.CancelledError:
+                logger.info(f"提取任务 {session_id} 被取消")
+                raise
+            except Exception as e:
+                logger.error(f"提取任务出错: {e}", exc_info=True)
+                await _send(websocket, {
+                    'type': 'error',
+                    'message': str(e)
+                })
+            finally:
+                # 任务完成后自动清理
+                await cleanup_extractor(websocket)
+        
+        websocket.state.task = asyncio.create_task(run_extraction())
+        
+        await _send(websocket, {
+            'type': 'log',
+            'message': f'开始提取 {len(urls)} 个URL的邮箱...',
+            'level': 'info'
+        })
+        
+    except Exception as e:
+        logger.error(f"初始化提取器失败: {e}", exc_info=True)
+        await _send(websocket, {
+            'type': 'error',
+            'message': f'初始化失败: {str(e)}'
+        })
+        await cleanup_extractor(websocket)
+
+async def _handle_pause(websocket: WebSocket, ext: EmailExtractor, message: dict):
+    if ext:
+        ext.pause()
+        await _send(websocket, {
+            'type': 'log',
+            'message': '已暂停',
+            'level': 'warning'
+        })
+
+async def _handle_resume(websocket: WebSocket, ext: EmailExtractor, message: dict):
+    if ext:
+        ext.resume()
+        await _send(websocket, {
+            'type': 'log',
+            'message': '已继续',
+            'level': 'info'
+        })
+
+async def _handle_stop(websocket: WebSocket, ext: EmailExtractor, message: dict):
+    if ext:
+        ext.stop()
+        await cleanup_extractor(websocket)
+        await _send(websocket, {
+            'type': 'log',
+            'message': '已停止',
+            'level': 'error'
+        })
+
+# action -> 处理协程, 每条消息只做一次字典查找
+_HANDLERS = {
+    'start': _handle_start,
+    'pause': _handle_pause,
+    'resume': _handle_resume,
+    'stop': _handle_stop,
+}
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     
-    extractor = None
+    websocket.state.extractor = None
+    websocket.state.task = None
+    websocket.state.send_queue = asyncio.Queue(maxsize=_SEND_QUEUE_SIZE)
+    websocket.state.progress = None  # 尚未发送的最新进度消息
+    flusher = asyncio.create_task(_flush_messages(websocket))
     session_id = str(id(websocket))
     
     logger.info(f"WebSocket 连接建立: {session_id}")
     
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            # 前端以二进制帧发送 UTF-8 JSON, orjson 直接解析字节; 仍兼容文本帧
+            frame = await websocket.receive()
+            if frame['type'] == 'websocket.disconnect':
+                raise WebSocketDisconnect(frame.get('code', 1000))
+            data = frame.get('bytes')
+            message = orjson.loads(data if data is not None else frame['text'])
             action = message.get('action')
             
             logger.info(f"收到消息: {action} from {session_id}")
             
-            if action == 'start':
-                # 如果已有运行中的实例,先清理
-                if session_id in active_extractors:
-                    logger.warning(f"检测到 {session_id} 已有运行实例,先清理...")
-                    old_extractor = active_extractors[session_id]
-                    await cleanup_extractor(session_id, old_extractor)
-                    # 等待资源完全释放
-                    await asyncio.sleep(1)
-                
-                urls = message.get('urls', [])
-                # show_browser = message.get('showBrowser', True)
-                show_browser = False
-                
-                logger.info(f"创建新的提取器实例: {session_id}, headless={not show_browser}, use_proxy_fallback={USE_PROXY}")
-                
-                # 创建新提取器（启用智能代理回退）
-                extractor = EmailExtractor(headless=not show_browser, use_proxy=USE_PROXY)
-                
-                try:
-                    await extractor.initialize()
-                    active_extractors[session_id] = extractor
-                    
-                    logger.info(f"提取器初始化成功: {session_id}")
-                    
-                    # 回调函数
-                    async def send_callback(msg_type, data, level='info'):
-                        try:
-                            await websocket.send_json({
-                                'type': msg_type,
-                                'message': data if msg_type == 'log' else None,
-                                'level': level if msg_type == 'log' else None,
-                                'emails': data if msg_type == 'email' else None,
-                                'progress': data if msg_type == 'progress' else None,
-                                'failed_urls': data if msg_type == 'failed_urls' else None,
-                                'no_email_urls': data if msg_type == 'no_email_urls' else None,
-                                'deduplicated_urls': data if msg_type == 'deduplicated_urls' else None,
-                            })
-                        except Exception as e:
-                            logger.error(f"发送消息失败: {e}")
-                    
-                    # 创建提取任务
-                    async def run_extraction():
-                        try:
-                            await extractor.extract_from_urls(urls, send_callback)
-                            await websocket.send_json({
-                                'type': 'complete',
-                                'message': '所有任务处理完毕'
-                            })
-                        except asyncio.CancelledError:
-                            logger.info(f"提取任务 {session_id} 被取消")
-                            raise
-                        except Exception as e:
-                            logger.error(f"提取任务出错: {e}", exc_info=True)
-                            await websocket.send_json({
-                                'type': 'error',
-                                'message': str(e)
-                            })
-                        finally:
-                            # 任务完成后自动清理
-                            await cleanup_extractor(session_id, extractor)
-                    
-                    task = asyncio.create_task(run_extraction())
-                    active_tasks[session_id] = task
-                    
-                    await websocket.send_json({
-                        'type': 'log',
-                        'message': f'开始提取 {len(urls)} 个URL的邮箱...',
-                        'level': 'info'
-                    })
-                    
-                except Exception as e:
-                    logger.error(f"初始化提取器失败: {e}", exc_info=True)
-                    await websocket.send_json({
-                        'type': 'error',
-                        'message': f'初始化失败: {str(e)}'
-                    })
-                    if extractor:
-                        await cleanup_extractor(session_id, extractor)
-                        extractor = None
-            
-            elif action == 'pause':
-                if session_id in active_extractors:
-                    active_extractors[session_id].pause()
-                    await websocket.send_json({
-                        'type': 'log',
-                        'message': '已暂停',
-                        'level': 'warning'
-                    })
-            
-            elif action == 'resume':
-                if session_id in active_extractors:
-                    active_extractors[session_id].resume()
-                    await websocket.send_json({
-                        'type': 'log',
-                        'message': '已继续',
-                        'level': 'info'
-                    })
-            
-            elif action == 'stop':
-                if session_id in active_extractors:
-                    active_extractors[session_id].stop()
-                    await cleanup_extractor(session_id, active_extractors[session_id])
-                    await websocket.send_json({
-                        'type': 'log',
-                        'message': '已停止',
-                        'level': 'error'
-                    })
+            handler = _HANDLERS.get(action)
+            if handler:
+                await handler(websocket, websocket.state.extractor, message)
     
     except WebSocketDisconnect:
         logger.info(f"WebSocket 断开: {session_id}")
     except Exception as e:
         logger.error(f"WebSocket 错误: {e}", exc_info=True)
         try:
-            await websocket.send_json({
+            await _send(websocket, {
                 'type': 'error',
                 'message': str(e)
             })
@@ -222,9 +289,11 @@ async def websocket_endpoint(websocket: WebSocket):
             pass
     finally:
         # 确保清理资源
-        if session_id in active_extractors:
+        if websocket.state.extractor is not None:
             logger.info(f"清理断开连接的 session: {session_id}")
-            await cleanup_extractor(session_id, active_extractors.get(session_id))
+            await cleanup_extractor(websocket)
+        # 先发完已排队的消息 (如上面的 error), 再停止发送协程
+        await _drain_messages(websocket, flusher)
 
 if __name__ == "__main__":
     import uvicorn
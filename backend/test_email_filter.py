@@ -0,0 +1,32 @@
+"""
+邮箱提取/过滤的离线回归检查 (不需要浏览器)
+运行: python backend/test_email_filter.py
+"""
+from email_extractor import EmailExtractor
+
+
+def _extract(text: str):
+    return sorted(EmailExtractor()._extract_emails_from_text(text))
+
+
+def test_prose_with_data_label_is_kept():
+    # 正文中的 "data:" 不是 data URI, 之后的邮箱不能被剔除
+    assert _extract('<p>Personal data: contact privacy@company.com for requests.</p>') == ['privacy@company.com']
+
+
+def test_data_uri_is_stripped():
+    html = '<img src="data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAAB@x.com"><p>info@site.org</p>'
+    assert _extract(html) == ['info@site.org']
+
+
+def test_attribute_only_emails_are_found():
+    # 整页 HTML 兜底扫描时, 只出现在属性值中的邮箱也要保留
+    html = '<div data-email="sales@acme.com" title="info@acme.com"></div><meta name=author content="boss@acme.com">'
+    assert _extract(html) == ['boss@acme.com', 'info@acme.com', 'sales@acme.com']
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"✓ {name}")